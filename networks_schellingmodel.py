@@ -4,117 +4,429 @@ import matplotlib.pyplot as plt
 from seaborn import heatmap, lineplot
 from matplotlib import animation
 
-class Node():
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+    prange = range
+    def njit(*args, **kwargs):
+        '''
+        Stand-in for numba.njit when numba is not installed, leaves the function as plain Python.
+        '''
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+### Color codes of the cells in the color grid.
+WHITE, RED, BLUE = 0, 1, 2
+
+### Encoding of the color codes used by to_np_colorcode and animate.
+COLORCODE = np.array([0, 100, -100], dtype=np.int64)
+
+### Stencil of the 8 cells surrounding a cell, vertex neighbors included.
+NEIGHBOR_KERNEL = np.array([[1, 1, 1],
+                            [1, 0, 1],
+                            [1, 1, 1]], dtype=np.int8)
+
+### Per color code weights packing a red count into the low and a blue count into
+### the high nibble of one byte, so one stencil sum yields both neighbor counts.
+### Boards keep their neighbor counts in this packed form.
+NIBBLE_CODE = np.array([0, 1, 16], dtype=np.uint8)
+
+def satisfaction_tables(pbound):
     '''
-    Singular node object, contains functionality for coloring in nodes.
-    Empty nodes are encoded as white.
+    Precomputes the satisfaction of a node for every packed neighbor count byte,
+    so the board never divides or compares against pbound per cell. A node whose
+    own color has count k out of d colored neighbors is satisfied when k reaches
+    the integer threshold need[d], the smallest k with k/d >= pbound. Cells without
+    colored neighbors have satisfaction 1.
     Arguments:
-        color: 'red', 'blue' or 'white'.
-        x: integer x value, used for distance calc.
-        y: integer y value, used for distance calc.
+        pbound: float, value below which nodes are unsatisfied.
+    Returns:
+        ratio: (3, 256) float array, ratio[color, packed] is the fraction of colored
+            neighbors of the given color, 1 for WHITE.
+        satisfies: (3, 256) bool array, whether a node of the given color with
+            these neighbor counts is satisfied, always for WHITE.
+        unsatisfied: (3, 256) bool array, whether a node of the given color with
+            these neighbor counts is unsatisfied, never for WHITE.
     '''
-    def __init__(self, color, x, y):
-        self.color =  color
-        self.x = x
-        self.y = y
-        self.neigh = set()
-        self.pval = 0
-        self.redval = 0
-        self.blueval = 0
-        self.update()
-    
-    def update(self):
-        '''
-        Updates nodes pval(how satisfied it is) and returns new pval.
-        Empty cells have pval of 1 by convention.
+    need = np.array([next((k for k in range(d+1) if (k/d if d else 1.0) >= pbound), d+1)
+                     for d in range(9)])
+
+    packed = np.arange(256)
+    red = packed & 15
+    blue = packed >> 4
+    denom = np.minimum(red + blue, 8)
+
+    ratio = np.ones((3, 256))
+    np.divide(red, denom, out=ratio[RED], where=denom > 0)
+    np.divide(blue, denom, out=ratio[BLUE], where=denom > 0)
+
+    satisfies = np.ones((3, 256), dtype=bool)
+    satisfies[RED] = red >= need[denom]
+    satisfies[BLUE] = blue >= need[denom]
+    unsatisfied = ~satisfies
+    unsatisfied[WHITE] = False
+    return ratio, satisfies, unsatisfied
+
+@njit(cache=True, inline='always')
+def update_cell(grid, neigh, pval, unsat, ratio, unsatisfied, i, j):
+    '''
+    Looks up the pval and unsatisfied flag of cell (i, j) from its packed neighbor
+    counts. Returns True if the unsatisfied flag flipped.
+    '''
+    color = grid[i, j]
+    pval[i, j] = ratio[color, neigh[i, j]]
 
-        Returns:
-            self.pval
-        '''
-        redcount = 0
-        bluecount = 0
-        for n in self.neigh:
-            if (n.color == 'blue'):
-                bluecount += 1
-            elif (n.color == 'red'):
-                redcount += 1
-
-        if redcount+bluecount == 0:
-            self.pval = 1
-            self.redval = 1
-            self.blueval = 1
-            return self.pval
-        
-        self.redval = redcount/(redcount+bluecount)
-        self.blueval = bluecount/(redcount+bluecount)
+    now = unsatisfied[color, neigh[i, j]]
+    if now != unsat[i, j]:
+        unsat[i, j] = now
+        return True
+    return False
 
-        if self.color == 'white':
-            self.pval = 1
-        elif self.color == 'red':
-            self.pval = self.redval
-        else:
-            self.pval = self.blueval
-        
-        return self.pval
+@njit(cache=True)
+def apply_delta(grid, neigh, pval, unsat, ratio, unsatisfied, r, c, new, changed):
+    '''
+    Recolors cell (r, c) and updates the packed neighbor counts, pvals and
+    unsatisfied flags of the cells within distance 1 of it, in place.
+    Arguments:
+        grid, neigh, pval, unsat: the board arrays to update.
+        ratio, unsatisfied: the board's satisfaction_tables.
+        r, c: integer, row and column of the recolored cell.
+        new: integer, new color code of the cell.
+        changed: integer array of length at least 9, receives the flat indices of
+            the cells whose unsatisfied flag flipped.
+    Returns:
+        n: integer, number of entries written to changed.
+    '''
+    size = grid.shape[0]
+    delta = int(NIBBLE_CODE[new]) - int(NIBBLE_CODE[grid[r, c]])
+    grid[r, c] = new
+    n = 0
+    for i in range(max(r-1, 0), min(r+2, size)):
+        for j in range(max(c-1, 0), min(c+2, size)):
+            if i != r or j != c:
+                neigh[i, j] = int(neigh[i, j]) + delta
+
+            if update_cell(grid, neigh, pval, unsat, ratio, unsatisfied, i, j):
+                changed[n] = i*size + j
+                n += 1
+    return n
+
+@njit(cache=True)
+def rescan_cells(grid, neigh, pval, unsat, ratio, unsatisfied, touched, window):
+    '''
+    Recounts the neighbors and looks up the pvals and unsatisfied flags of every cell
+    within distance 1 of the touched cells, in place, from the current color grid.
+    Arguments:
+        grid, neigh, pval, unsat: the board arrays to update.
+        ratio, unsatisfied: the board's satisfaction_tables.
+        touched: integer array of flat indices of the cells whose color changed.
+        window: integer array of length at least 9*len(touched), receives the flat
+            indices of the rescanned cells, possibly repeated.
+    Returns:
+        n: integer, number of entries written to window.
+    '''
+    size = grid.shape[0]
+    n = 0
+    for t in touched:
+        r = t // size
+        c = t % size
+        for i in range(max(r-1, 0), min(r+2, size)):
+            for j in range(max(c-1, 0), min(c+2, size)):
+                packed = 0
+                for k in range(max(i-1, 0), min(i+2, size)):
+                    for l in range(max(j-1, 0), min(j+2, size)):
+                        packed += NIBBLE_CODE[grid[k, l]]
+                neigh[i, j] = packed - NIBBLE_CODE[grid[i, j]]
+                update_cell(grid, neigh, pval, unsat, ratio, unsatisfied, i, j)
+                window[n] = i*size + j
+                n += 1
+    return n
+
+if HAS_NUMBA:
+    @njit(parallel=True, cache=True, fastmath=True)
+    def scan_board(grid, neigh, pval, unsat, ratio, unsatisfied):
+        '''
+        Counts the red and blue neighbors of every cell and looks up the pvals and
+        unsatisfied flags of the whole board, in place. Rows are distributed over
+        all cores. Each row slides the 3x3 window along as three column sums, so
+        every column sum is read once and reused by three cells.
+        '''
+        size = grid.shape[0]
+        for i in prange(size):
+            k0 = max(i-1, 0)
+            k1 = min(i+2, size)
+            left = 0
+            middle = 0
+            for k in range(k0, k1):
+                middle += NIBBLE_CODE[grid[k, 0]]
+            for j in range(size):
+                right = 0
+                if j+1 < size:
+                    for k in range(k0, k1):
+                        right += NIBBLE_CODE[grid[k, j+1]]
+                neigh[i, j] = left + middle + right - NIBBLE_CODE[grid[i, j]]
+                update_cell(grid, neigh, pval, unsat, ratio, unsatisfied, i, j)
+                left = middle
+                middle = right
+else:
+    from scipy.ndimage import convolve
+
+    def scan_board(grid, neigh, pval, unsat, ratio, unsatisfied):
+        '''
+        Counts the red and blue neighbors of every cell and looks up the pvals and
+        unsatisfied flags of the whole board, in place. Without numba the neighbor
+        counts are a 3x3 stencil over the color grid, computed with a convolution.
+        '''
+        convolve(NIBBLE_CODE[grid], NEIGHBOR_KERNEL.astype(np.uint8), output=neigh, mode='constant')
+        pval[...] = ratio[grid, neigh]
+        unsat[...] = unsatisfied[grid, neigh]
 
-    def setcolor(self, color):
+if HAS_NUMBA:
+    @njit(parallel=True, cache=True)
+    def swap_cells(cells, movers, empties):
         '''
-        Sets the color of a node.
+        Moves the color of every cell in movers into the paired cell of empties,
+        leaving the movers white. The pairs are disjoint, so they are moved in
+        parallel over all cores.
         Arguments:
-            color: 'red', 'blue' or 'white'.
+            cells: the flattened color grid.
+            movers, empties: integer arrays of flat indices of equal length.
         '''
-        self.color = color
-
-    def color_and_update(self, color, pbound):
+        for k in prange(len(movers)):
+            cells[empties[k]] = cells[movers[k]]
+            cells[movers[k]] = WHITE
+else:
+    def swap_cells(cells, movers, empties):
         '''
-        Colors in node and updates all neighbors. Returns neighbors below bound.
-        Originally implemented for localized updating optimization, deprecated as
-        of current implementation.
-
-        'Premature optimization is the root of all evil.' - Donald Knuth
+        Moves the color of every cell in movers into the paired cell of empties,
+        leaving the movers white.
+        '''
+        cells[empties] = cells[movers]
+        cells[movers] = WHITE
 
+if HAS_NUMBA:
+    @njit(cache=True)
+    def find_closest_satisfying(x, y, size, wx, wy, cells, n, pos, neigh, satisfies):
+        '''
+        Returns the slot of the cell closest to (x, y) among the first n cells whose
+        packed neighbor counts satisfy, or -1 if none does.
+        The board itself serves as the spatial index: square rings of growing radius
+        around (x, y) are scanned for pool members, and the search stops once no cell
+        further out can beat the best one found. When the rings would cover more
+        cells than the pool holds, one pass over the pool is cheaper and used instead.
         Arguments:
-            color: 'red', 'blue' or 'white'.
-            pbound: float, value below which nodes are unsatisfied.
-        Returns:
-            unsatisfied: list of unsatisfied neighbors, including itself.
+            x, y: integers, row and column to measure the distance from.
+            size: integer, size of one side of the board.
+            wx, wy, cells, pos: the row, column, flat index and slot arrays of a CellPool.
+            n: integer, number of cells in the pool.
+            neigh: the flattened packed neighbor counts of the board.
+            satisfies: (256,) bool array, the row of the board's satisfies table
+                for the color being placed.
         '''
+        best = -1
+        best_d2 = 0
+        r = 0
+        while (2*r+1)*(2*r+1) <= n and r < size:
+            if best >= 0 and r*r > best_d2:
+                return pos[best]
+            for i in range(max(x-r, 0), min(x+r+1, size)):
+                ### Edge rows of the ring are scanned fully, inner rows only at both ends.
+                step = 1 if (i == x-r or i == x+r) else 2*r
+                for j in range(y-r, y+r+1, step):
+                    if j < 0 or j >= size:
+                        continue
+                    c = i*size + j
+                    if pos[c] >= 0 and satisfies[neigh[c]]:
+                        d2 = (i-x)**2 + (j-y)**2
+                        if best < 0 or d2 < best_d2:
+                            best = c
+                            best_d2 = d2
+            r += 1
+        if best >= 0 and r*r > best_d2:
+            return pos[best]
+
+        best = -1
+        for k in range(n):
+            if satisfies[neigh[cells[k]]]:
+                d2 = (wx[k]-x)**2 + (wy[k]-y)**2
+                if best < 0 or d2 < best_d2:
+                    best = k
+                    best_d2 = d2
+        return best
+else:
+    def find_closest_satisfying(x, y, size, wx, wy, cells, n, pos, neigh, satisfies):
+        '''
+        Returns the slot of the cell closest to (x, y) among the first n cells whose
+        packed neighbor counts satisfy, or -1 if none does. Candidates are filtered
+        by mask first, so squared distances are only computed for the satisfying cells.
+        '''
+        ok = np.flatnonzero(satisfies[neigh[cells[:n]]])
+        if len(ok) == 0:
+            return -1
+        d2 = (wx[ok]-x)**2 + (wy[ok]-y)**2
+        return ok[d2.argmin()]
+
+if HAS_NUMBA:
+    @njit(cache=True)
+    def count_satisfying(cells, n, neigh, satisfies):
+        '''
+        Returns the number of the first n cells whose packed neighbor counts satisfy.
+        Arguments:
+            cells: the flat index array of a CellPool.
+            n: integer, number of cells in the pool.
+            neigh: the flattened packed neighbor counts of the board.
+            satisfies: (256,) bool array, the row of the board's satisfies table
+                for the color being placed.
+        '''
+        count = 0
+        for k in range(n):
+            if satisfies[neigh[cells[k]]]:
+                count += 1
+        return count
+
+    @njit(cache=True)
+    def nth_satisfying(cells, n, neigh, satisfies, nth):
+        '''
+        Returns the cell that is the nth, counting from 0, of the first n cells whose
+        packed neighbor counts satisfy, or -1 if there are not that many.
+        '''
+        for k in range(n):
+            if satisfies[neigh[cells[k]]]:
+                if nth == 0:
+                    return cells[k]
+                nth -= 1
+        return -1
+else:
+    def count_satisfying(cells, n, neigh, satisfies):
+        '''
+        Returns the number of the first n cells whose packed neighbor counts satisfy.
+        '''
+        return np.count_nonzero(satisfies[neigh[cells[:n]]])
 
-        self.color = color
-        self.update()
-
-        unsatisfied = []
-        for n in self.neigh:
-            npval = n.update()
-            if npval < pbound and n.color != 'white':
-                unsatisfied.append(n)
-        if self.pval < pbound and self.color != 'white':
-            unsatisfied.append(self)
-
-        return unsatisfied
+    def nth_satisfying(cells, n, neigh, satisfies, nth):
+        '''
+        Returns the cell that is the nth, counting from 0, of the first n cells whose
+        packed neighbor counts satisfy, or -1 if there are not that many.
+        '''
+        satisfying = cells[:n][satisfies[neigh[cells[:n]]]]
+        return satisfying[nth] if nth < len(satisfying) else -1
 
-def distance(n1, n2):
+def numpy_rng():
     '''
-    Distance calculation helper function.
-    Arguments:
-        n1, n2: The nodes between which to calculate the distance.
-    Returns:
-        distance: float, Euclidean distance.
+    Returns a numpy Generator seeded from the random module, for the draws that are
+    vectorized with numpy. All randomness then flows from the random module, so
+    random.seed alone reproduces a run.
     '''
-    return ((n1.x-n2.x)**2+(n1.y-n2.y)**2)**0.5
+    return np.random.default_rng(random.getrandbits(64))
 
-def bind_nodes(n1, n2):
+class CellPool():
     '''
-    Makes nodes neighbors, and updates each node.
+    Set of cells with O(1) append, remove and random pick. Cells are kept packed at
+    the front of an index array together with a reverse map from each cell to its
+    slot, so removing a cell moves the last cell into the freed slot. The x and y
+    coordinates of the cells are kept in parallel arrays for distance calculations.
+    Arguments:
+        size: integer, size of one side of the game board.
     '''
-    n1.neigh.add(n2)
-    n2.neigh.add(n1)
-    n1.update()
-    n2.update()
+    __slots__ = ('size', 'cells', 'x', 'y', 'pos', 'slots', 'n')
+
+    def __init__(self, size):
+        self.size = size
+        self.cells = np.empty(size**2, dtype=np.int32)
+        self.x = np.empty(size**2, dtype=np.int32)
+        self.y = np.empty(size**2, dtype=np.int32)
+        self.pos = np.full(size**2, -1, dtype=np.int32)
+        self.slots = np.arange(size**2, dtype=np.int32)
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return iter(self.cells[:self.n].tolist())
+
+    def reset(self, cells):
+        '''
+        Replaces the contents of the pool.
+        Arguments:
+            cells: integer array of flat cell indices.
+        '''
+        self.pos[self.cells[:self.n]] = -1
+        self.n = len(cells)
+        self.cells[:self.n] = cells
+        np.divmod(self.cells[:self.n], self.size, out=(self.x[:self.n], self.y[:self.n]))
+        self.pos[cells] = self.slots[:self.n]
+
+    def append(self, cell):
+        self.cells[self.n] = cell
+        self.x[self.n], self.y[self.n] = divmod(cell, self.size)
+        self.pos[cell] = self.n
+        self.n += 1
+
+    def remove(self, cell):
+        slot = self.pos[cell]
+        last = self.n-1
+        moved = self.cells[last]
+        self.cells[slot] = moved
+        self.x[slot] = self.x[last]
+        self.y[slot] = self.y[last]
+        self.pos[moved] = slot
+        self.pos[cell] = -1
+        self.n -= 1
+
+    def pick(self):
+        '''
+        Returns a uniformly random cell of a non-empty pool.
+        '''
+        return int(self.cells[random.randrange(self.n)])
+
+    def shuffle(self):
+        '''
+        Puts the cells of the pool in uniformly random slot order.
+        '''
+        cells = self.cells[:self.n].copy()
+        numpy_rng().shuffle(cells)
+        self.reset(cells)
+
+    def last(self):
+        '''
+        Returns the cell in the last slot of a non-empty pool. After shuffle, taking
+        and removing the last cell draws the pool in random order without repeats.
+        '''
+        return int(self.cells[self.n-1])
+
+    def sample(self, k):
+        '''
+        Returns an array of k distinct uniformly random cells of the pool.
+        '''
+        return self.cells[numpy_rng().choice(self.n, k, replace=False)]
+
+    def closest_satisfying(self, x, y, neigh, satisfies):
+        '''
+        Returns the cell closest to (x, y) among those that satisfy, or None if no
+        cell does. Every cell satisfies the WHITE row of the satisfies table, so
+        passing it finds the closest cell of the pool.
+        Arguments:
+            x, y: integers, row and column to measure the distance from.
+            neigh: the flattened packed neighbor counts of the board.
+            satisfies: (256,) bool array, the row of the board's satisfies table
+                for the color being placed.
+        '''
+        k = find_closest_satisfying(x, y, self.size, self.x, self.y, self.cells, self.n,
+                                    self.pos, neigh, satisfies)
+        if k < 0:
+            return None
+        return int(self.cells[k])
 
 class Board():
     '''
-    The main game object.
+    The main game object. The board is stored as a (size, size) uint8 color grid
+    of the WHITE (empty), RED and BLUE color codes. Cells are referred to by their
+    flat index i*size + j into the grid. All random draws come from the random
+    module, so calling random.seed before building a board reproduces the run.
     Arguments:
         size: integer, size of one side of the game board.
         whiteP: float, percent of empty nodes.
@@ -123,786 +435,746 @@ class Board():
         stopping: float optional, for 'closest' assignment algorithm. Stops if the
             number of unsatisfied nodes is below stopping. Avoids getting stuck.
             If running 'closest' assignments, keep in the 5-20 range.
+        verbose: bool optional, print the number of unsatisfied and white nodes
+            after every step.
     '''
-    def __init__(self, size, whiteP, redP, pbound, stopping = 1):
+    def __init__(self, size, whiteP, redP, pbound, stopping = 1, verbose = False):
         self.size = size
         self.pbound = pbound
+        self.ratio_table, self.satisfies, self.unsat_table = satisfaction_tables(pbound)
         self.white_count = int(size**2*whiteP)
         self.red_count = int(size**2*redP*(1-whiteP))
         self.blue_count = size**2 - self.red_count - self.white_count
-        self.unsatisfied = []
-        self.whiteCells = []
-        self.board = self.build_board()
-        self.animationList = []
+        self.unsatisfied = CellPool(size)
+        self.whiteCells = CellPool(size)
+        self._changed = np.empty(9, dtype=np.int64)
+        self._moved = []
+
+        ### Board arrays, allocated once and overwritten in place by every scan.
+        self.neigh = np.empty((size, size), dtype=np.uint8)
+        self.pval = np.empty((size, size))
+        self.unsat_grid = np.empty((size, size), dtype=bool)
+        self.color_grid = self.build_board()
+        self.reload_sets()
+        self.frames = np.empty((0, size, size), dtype=np.uint8)
+        self.frame_count = 0
         self.stopping = stopping
+        self.verbose = verbose
     
-    def reload_sets(self):
+    @property
+    def animationList(self):
         '''
-        Scan board and rebould the unsatisfied and whiteCells sets.
+        The recorded frames, a (frames, size, size) copy of the frame buffer.
         '''
-        new_whiteCells = []
-        new_unsatisfied = []
+        return self.frames[:self.frame_count].copy()
 
-        for row in self.board:
-            for node in row:
-                pval = node.update()
-                if node.color == 'white':
-                    new_whiteCells.append(node)
-                elif pval < self.pbound:
-                    new_unsatisfied.append(node)
+    @animationList.setter
+    def animationList(self, frames):
+        '''
+        Replaces the recorded frames, e.g. board.animationList = [] clears them.
+        '''
+        frames = np.asarray(frames, dtype=np.uint8).reshape(-1, self.size, self.size)
+        self.frame_count = 0
+        self.reserve_frames(len(frames))
+        self.frames[:len(frames)] = frames
+        self.frame_count = len(frames)
 
-        self.unsatisfied = new_unsatisfied
-        self.whiteCells = new_whiteCells
+    def reserve_frames(self, count):
+        '''
+        Makes room in the frame buffer for at least count more frames.
+        '''
+        needed = self.frame_count + count
+        if needed > len(self.frames):
+            frames = np.empty((needed, self.size, self.size), dtype=np.uint8)
+            frames[:self.frame_count] = self.frames[:self.frame_count]
+            self.frames = frames
 
-    def sample_color(self):
+    def record_frame(self):
         '''
-        Returns one of the available colors. Helper for building the board.
+        Copies the color grid into the next slot of the frame buffer, doubling the
+        buffer when it is full.
         '''
-        color = random.sample(['white', 'red', 'blue'], counts=[self.white_count, self.red_count, self.blue_count], k=1)[0]
-        if color == 'white':
-            self.white_count -= 1
-        elif color == 'red':
-            self.red_count -= 1
-        elif color == 'blue':
-            self.blue_count -= 1
-        return color
-    
-    def build_board(self):
+        if self.frame_count == len(self.frames):
+            self.reserve_frames(max(self.frame_count, 16))
+        self.frames[self.frame_count] = self.color_grid
+        self.frame_count += 1
+
+    def reload_sets(self):
         '''
-        Builds board list of nodes. Returns board list.
+        Scan board and rebuild the neighbor counts, pvals and the unsatisfied and
+        whiteCells sets.
+
+        Empty cells have pval of 1 by convention, cells without colored neighbors
+        have pval of 1 and satisfy either color.
         '''
+        grid = self.color_grid
+        scan_board(grid, self.neigh, self.pval, self.unsat_grid, self.ratio_table, self.unsat_table)
 
-        ### Build (0,0)
-        board = [[Node(self.sample_color(), 0, 0)]]
+        self.whiteCells.reset(np.flatnonzero(grid == WHITE))
+        self.unsatisfied.reset(np.flatnonzero(self.unsat_grid))
+        self._moved.clear()
 
-        ### Build first row
-        for _ in range(1, self.size):
-            new_node = Node(self.sample_color(), 0, _)
-            bind_nodes(board[0][_-1], new_node)
-            board[0].append(new_node)
-        
-        ### Build rest of board
-        for i in range(1, self.size):
-            board.append([])
-            for j in range(self.size):
-                new_node = Node(self.sample_color(), i, j)
-                if j == 0:
-                    bind_nodes(board[i-1][j+1], new_node)
-                elif j == self.size - 1:
-                    bind_nodes(board[i][j-1], new_node)
-                    bind_nodes(board[i-1][j-1], new_node)
-                else:
-                    bind_nodes(board[i][j-1], new_node)
-                    bind_nodes(board[i-1][j-1], new_node)
-                    bind_nodes(board[i-1][j+1], new_node)
+    def settle_batch(self):
+        '''
+        Brings the neighbor counts, pvals and both sets up to date after a batch of
+        move_cell calls. Only the neighborhoods of the moved cells are rescanned and
+        resynced. Batches touching a large part of the board, or any batch without
+        numba, rescan the whole board with reload_sets instead.
+        '''
+        touched = np.array(self._moved, dtype=np.int64)
+        self._moved.clear()
+        if not HAS_NUMBA or 9*len(touched) > self.size**2//4:
+            self.reload_sets()
+            return
+
+        window = np.empty(9*len(touched), dtype=np.int64)
+        n = rescan_cells(self.color_grid, self.neigh, self.pval, self.unsat_grid,
+                         self.ratio_table, self.unsat_table, touched, window)
+        cells = np.unique(window[:n])
+        for pool, wanted in ((self.whiteCells, self.color_grid.ravel()[cells] == WHITE),
+                             (self.unsatisfied, self.unsat_grid.ravel()[cells])):
+            present = pool.pos[cells] >= 0
+            for cell in cells[wanted & ~present].tolist():
+                pool.append(cell)
+            for cell in cells[present & ~wanted].tolist():
+                pool.remove(cell)
 
-                bind_nodes(board[i-1][j], new_node)
-                board[i].append(new_node)
+    def build_board(self):
+        '''
+        Builds the color grid of the board as a random arrangement of exactly
+        white_count white, red_count red and blue_count blue cells. Returns the grid.
+        '''
+        cells = np.repeat(np.array([WHITE, RED, BLUE], dtype=np.uint8),
+                          [self.white_count, self.red_count, self.blue_count])
+        numpy_rng().shuffle(cells)
+        return cells.reshape(self.size, self.size)
 
-        ### Build initial unsatisfied and whiteCells lists
-        for row in board:
-            for node in row:
-                pval = node.update()
-                if node.color == 'white':
-                    self.whiteCells.append(node)
-                elif pval < self.pbound:
-                    self.unsatisfied.append(node)
+    def move_cell(self, Moving, Empty):
+        '''
+        Moves the color of cell Moving into cell Empty, leaving Moving white.
+        Neighbor counts are left untouched until the batch is settled.
+        Arguments:
+            Moving: integer, flat index of the colored cell to move.
+            Empty: integer, flat index of the empty cell to move it to.
+        '''
+        cells = self.color_grid.ravel()
+        cells[Empty] = cells[Moving]
+        cells[Moving] = WHITE
+        self._moved.append(Moving)
+        self._moved.append(Empty)
+
+    def random_satisfying(self, color):
+        '''
+        Returns a uniformly random cell of whiteCells in which a node of the given
+        color would be satisfied, or None if there is no such cell.
+        Arguments:
+            color: integer, color code of the moving node.
+        '''
+        whites = self.whiteCells
+        neigh = self.neigh.ravel()
+        count = count_satisfying(whites.cells, whites.n, neigh, self.satisfies[color])
+        if count == 0:
+            return None
+        return int(nth_satisfying(whites.cells, whites.n, neigh, self.satisfies[color], random.randrange(count)))
+
+    def color_and_update(self, Moving, Empty):
+        '''
+        Moves the color of cell Moving into cell Empty, leaving Moving white, and
+        updates only the neighbors of the two cells. Used by single updating in
+        place of move_cell followed by a full reload_sets.
+        Arguments:
+            Moving: integer, flat index of the colored cell to move.
+            Empty: integer, flat index of the empty cell to move it to.
+        '''
+        ### The deltas build on current neighbor counts, so settle any pending batch moves first.
+        if self._moved:
+            self.settle_batch()
+        color = self.color_grid.flat[Moving]
+        for cell, new in ((Moving, WHITE), (Empty, color)):
+            r, c = divmod(cell, self.size)
+            n = apply_delta(self.color_grid, self.neigh, self.pval, self.unsat_grid,
+                            self.ratio_table, self.unsat_table, r, c, new, self._changed)
+            for changed in self._changed[:n].tolist():
+                if self.unsat_grid.flat[changed]:
+                    self.unsatisfied.append(changed)
+                else:
+                    self.unsatisfied.remove(changed)
 
-        return board
+        self.whiteCells.remove(Empty)
+        self.whiteCells.append(Moving)
 
     def step_single_random(self):
-        Moving = random.sample(self.unsatisfied, k=1)[0]
-        Empty = random.sample(self.whiteCells, k=1)[0]
+        Moving = self.unsatisfied.pick()
+        Empty = self.whiteCells.pick()
 
-        Empty.setcolor(Moving.color)
-        Moving.setcolor('white')
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
-        self.animationList.append(self.to_np_colorcode())
+        self.color_and_update(Moving, Empty)
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
+        self.record_frame()
 
         return True
 
     def step_single_randomSat_stop(self):
-        Moving = random.sample(self.unsatisfied, k=1)[0]
-        random.shuffle(self.whiteCells)
-        Empty = None
-        color = Moving.color
+        Moving = self.unsatisfied.pick()
+        color = self.color_grid.flat[Moving]
         
         ### Find Satisfying
-        if color == 'red':
-            for Candidate in self.whiteCells:
-                if Candidate.redval >= self.pbound:
-                    Empty = Candidate
-                    break
-        elif color == 'blue':
-            for Candidate in self.whiteCells:
-                if Candidate.blueval >=self.pbound:
-                    Empty = Candidate
-                    break
+        Empty = self.random_satisfying(color)
         
         ### No candidate for current color, try other color
         if Empty == None:
             # print(f"CANT FIND SPOT FOR {color} CELL")
             for OtherMoving in self.unsatisfied:
-                otherColor = OtherMoving.color
+                otherColor = self.color_grid.flat[OtherMoving]
                 
                 if otherColor == color:
                     continue
 
-                if otherColor == 'red':
-                    for Candidate in self.whiteCells:
-                        if Candidate.redval >= self.pbound:
-                            Moving = OtherMoving
-                            Empty = Candidate
-                            break
-                elif otherColor == 'blue':
-                    for Candidate in self.whiteCells:
-                        if Candidate.blueval >=self.pbound:
-                            Moving = OtherMoving
-                            Empty = Candidate
-                            break
-                
-                if Empty == None:
-                    print(f"CATASTROPHIC STOP NO CELLS FOR RED OR BLUE!!!")
-                    return False
+                Moving = OtherMoving
+                Empty = self.random_satisfying(otherColor)
+                break
+
+            if Empty == None:
+                print(f"CATASTROPHIC STOP NO CELLS FOR RED OR BLUE!!!")
+                return False
         
-        Empty.setcolor(Moving.color)
-        Moving.setcolor('white')
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
-        self.animationList.append(self.to_np_colorcode())
+        self.color_and_update(Moving, Empty)
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
+        self.record_frame()
 
         return True
                 
     def step_single_randomSat_cont(self):
-        Moving = random.sample(self.unsatisfied, k=1)[0]
-        random.shuffle(self.whiteCells)
-        Empty = None
-        color = Moving.color
+        Moving = self.unsatisfied.pick()
+        color = self.color_grid.flat[Moving]
         
         ### Find Satisfying
-        if color == 'red':
-            for Candidate in self.whiteCells:
-                if Candidate.redval >= self.pbound:
-                    Empty = Candidate
-                    break
-        elif color == 'blue':
-            for Candidate in self.whiteCells:
-                if Candidate.blueval >=self.pbound:
-                    Empty = Candidate
-                    break
+        Empty = self.random_satisfying(color)
         
         ### No candidate for current color, select random
         if Empty == None:
             # print(f"CANT FIND SPOT FOR {color} CELL")
-            Empty = random.sample(self.whiteCells, k=1)[0]
+            Empty = self.whiteCells.pick()
         
-        Empty.setcolor(Moving.color)
-        Moving.setcolor('white')
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
-        self.animationList.append(self.to_np_colorcode())
+        self.color_and_update(Moving, Empty)
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
+        self.record_frame()
 
         return True
 
     def step_single_closest(self):
-        Moving = random.sample(self.unsatisfied, k=1)[0]
-        self.whiteCells.sort(key = lambda Node: distance(Moving, Node))
-        Empty = self.whiteCells[0]
+        Moving = self.unsatisfied.pick()
+        Empty = self.whiteCells.closest_satisfying(*divmod(Moving, self.size), self.neigh.ravel(), self.satisfies[WHITE])
         if len(self.unsatisfied)<self.stopping:
             return False
         
-        Empty.setcolor(Moving.color)
-        Moving.setcolor('white')
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
-        self.animationList.append(self.to_np_colorcode())
+        self.color_and_update(Moving, Empty)
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
+        self.record_frame()
         return True
     
     def step_single_closestSat_stop(self):
-        Moving = random.sample(self.unsatisfied, k=1)[0]
-        self.whiteCells.sort(key = lambda Node: distance(Moving, Node))
-        Empty = None
-        color = Moving.color
+        Moving = self.unsatisfied.pick()
+        mx, my = divmod(Moving, self.size)
+        color = self.color_grid.flat[Moving]
         if len(self.unsatisfied)<self.stopping:
             return False
         
         ### Find Satisfying
-        if color == 'red':
-            for Candidate in self.whiteCells:
-                if Candidate.redval >= self.pbound:
-                    Empty = Candidate
-                    break
-        elif color == 'blue':
-            for Candidate in self.whiteCells:
-                if Candidate.blueval >=self.pbound:
-                    Empty = Candidate
-                    break
+        Empty = self.whiteCells.closest_satisfying(mx, my, self.neigh.ravel(), self.satisfies[color])
         
         ### No candidate for current color, try other color
         if Empty == None:
             # print(f"CANT FIND SPOT FOR {color} CELL")
             for OtherMoving in self.unsatisfied:
-                otherColor = OtherMoving.color
+                otherColor = self.color_grid.flat[OtherMoving]
                 
                 if otherColor == color:
                     continue
                 
-                self.whiteCells.sort(key = lambda Node: distance(OtherMoving, Node))
-                if otherColor == 'red':
-                    for Candidate in self.whiteCells:
-                        if Candidate.redval >= self.pbound:
-                            Moving = OtherMoving
-                            Empty = Candidate
-                            break
-                elif otherColor == 'blue':
-                    for Candidate in self.whiteCells:
-                        if Candidate.blueval >=self.pbound:
-                            Moving = OtherMoving
-                            Empty = Candidate
-                            break
+                ox, oy = divmod(OtherMoving, self.size)
+                Moving = OtherMoving
+                Empty = self.whiteCells.closest_satisfying(ox, oy, self.neigh.ravel(), self.satisfies[otherColor])
                 
-                if Empty == None:
-                    print(f"CATASTROPHIC STOP NO CELLS FOR RED OR BLUE!!!")
-                    return False
+                break
+
+            if Empty == None:
+                print(f"CATASTROPHIC STOP NO CELLS FOR RED OR BLUE!!!")
+                return False
         
-        Empty.setcolor(Moving.color)
-        Moving.setcolor('white')
-        self.reload_sets()
-        # print(len(self.unsatisfied), len(self.whiteCells))
-        self.animationList.append(self.to_np_colorcode())
+        self.color_and_update(Moving, Empty)
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
+        self.record_frame()
 
         return True
     
     def step_single_closestSat_cont(self):
-        Moving = random.sample(self.unsatisfied, k=1)[0]
-        self.whiteCells.sort(key = lambda Node: distance(Moving, Node))
-        Empty = None
-        color = Moving.color
+        Moving = self.unsatisfied.pick()
+        mx, my = divmod(Moving, self.size)
+        color = self.color_grid.flat[Moving]
         if len(self.unsatisfied)<self.stopping:
             return False
         
         ### Find Satisfying
-        if color == 'red':
-            for Candidate in self.whiteCells:
-                if Candidate.redval >= self.pbound:
-                    Empty = Candidate
-                    break
-        elif color == 'blue':
-            for Candidate in self.whiteCells:
-                if Candidate.blueval >=self.pbound:
-                    Empty = Candidate
-                    break
+        Empty = self.whiteCells.closest_satisfying(mx, my, self.neigh.ravel(), self.satisfies[color])
         
         ### No candidate for current color, select closest
         if Empty == None:
             # print(f"CANT FIND SPOT FOR {color} CELL")
-            Empty = self.whiteCells[0]
+            Empty = self.whiteCells.closest_satisfying(mx, my, self.neigh.ravel(), self.satisfies[WHITE])
         
-        Empty.setcolor(Moving.color)
-        Moving.setcolor('white')
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
-        self.animationList.append(self.to_np_colorcode())
+        self.color_and_update(Moving, Empty)
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
+        self.record_frame()
 
         return True
     
     def step_whitebatch_random(self):
+        unsatisfied, whites = self.unsatisfied, self.whiteCells
+        unsatisfied.shuffle()
+        while (unsatisfied and whites):
+            Moving = unsatisfied.last()
+            Empty = whites.pick()
+            whites.remove(Empty)
+            unsatisfied.remove(Moving)
+            whites.append(Moving)
 
-        while (self.unsatisfied and self.whiteCells):
-            Moving = random.sample(self.unsatisfied, k=1)[0]
-            Empty = random.sample(self.whiteCells, k=1)[0]
-            self.whiteCells.remove(Empty)
-            self.unsatisfied.remove(Moving)
-            self.whiteCells.append(Moving)
-
-            Empty.setcolor(Moving.color)
-            Moving.setcolor('white')
+            self.move_cell(Moving, Empty)
 
         
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
+        self.settle_batch()
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
 
-        self.animationList.append(self.to_np_colorcode())
+        self.record_frame()
         return True
     
     def step_batch_random(self):
 
-        while self.unsatisfied and self.whiteCells:
-            Moving = random.sample(self.unsatisfied, k=1)[0]
-            Empty = random.sample(self.whiteCells, k=1)[0]
-            self.whiteCells.remove(Empty)
-            self.unsatisfied.remove(Moving)
-
-            Empty.setcolor(Moving.color)
-            Moving.setcolor('white')
+        ### Every unsatisfied cell or every white cell moves, to a random partner
+        ### taken without replacement, so the pairs can be moved all at once.
+        k = min(len(self.unsatisfied), len(self.whiteCells))
+        movers, empties = self.unsatisfied.sample(k), self.whiteCells.sample(k)
+        swap_cells(self.color_grid.ravel(), movers, empties)
+        self._moved.extend(movers.tolist())
+        self._moved.extend(empties.tolist())
         
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
+        self.settle_batch()
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
 
-        self.animationList.append(self.to_np_colorcode())
+        self.record_frame()
         return True
 
     def step_whitebatch_randomSat_stop(self):
-        while self.unsatisfied and self.whiteCells:
-            Moving = random.sample(self.unsatisfied, k=1)[0]
-            random.shuffle(self.whiteCells)
-            Empty = None
-            color = Moving.color
+        unsatisfied, whites = self.unsatisfied, self.whiteCells
+        cells = self.color_grid.ravel()
+        unsatisfied.shuffle()
+        while unsatisfied and whites:
+            Moving = unsatisfied.last()
+            color = cells[Moving]
 
             ### Find Satisfying
-            if color == 'red':
-                for Candidate in self.whiteCells:
-                    if Candidate.redval >= self.pbound:
-                        Empty = Candidate
-                        break
-            elif color == 'blue':
-                for Candidate in self.whiteCells:
-                    if Candidate.blueval >=self.pbound:
-                        Empty = Candidate
-                        break
+            Empty = self.random_satisfying(color)
             
             ### No candidate for current color, try other color
             if Empty == None:
                 # print(f"CANT FIND SPOT FOR {color} CELL")
-                for OtherMoving in self.unsatisfied:
-                    otherColor = OtherMoving.color
+                for OtherMoving in unsatisfied:
+                    otherColor = cells[OtherMoving]
                     
                     if otherColor == color:
                         continue
 
-                    if otherColor == 'red':
-                        for Candidate in self.whiteCells:
-                            if Candidate.redval >= self.pbound:
-                                Moving = OtherMoving
-                                Empty = Candidate
-                                break
-                    elif otherColor == 'blue':
-                        for Candidate in self.whiteCells:
-                            if Candidate.blueval >=self.pbound:
-                                Moving = OtherMoving
-                                Empty = Candidate
-                                break
-                    
-                    if Empty == None:
-                        print(f"CATASTROPHIC STOP NO CELLS FOR RED OR BLUE!!!")
-                        return False
+                    Moving = OtherMoving
+                    Empty = self.random_satisfying(otherColor)
+                    break
+
+                if Empty == None:
+                    print(f"CATASTROPHIC STOP NO CELLS FOR RED OR BLUE!!!")
+                    self.settle_batch()
+                    return False
                     
-            self.whiteCells.remove(Empty)
-            self.unsatisfied.remove(Moving)
-            self.whiteCells.append(Moving)
+            whites.remove(Empty)
+            unsatisfied.remove(Moving)
+            whites.append(Moving)
             
-            Empty.setcolor(Moving.color)
-            Moving.setcolor('white')
+            self.move_cell(Moving, Empty)
         
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
+        self.settle_batch()
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
 
-        self.animationList.append(self.to_np_colorcode())
+        self.record_frame()
         return True
     
     def step_batch_randomSat_stop(self):
-        while self.unsatisfied and self.whiteCells:
-            Moving = random.sample(self.unsatisfied, k=1)[0]
-            random.shuffle(self.whiteCells)
-            Empty = None
-            color = Moving.color
+        unsatisfied, whites = self.unsatisfied, self.whiteCells
+        cells = self.color_grid.ravel()
+        unsatisfied.shuffle()
+        while unsatisfied and whites:
+            Moving = unsatisfied.last()
+            color = cells[Moving]
 
             ### Find Satisfying
-            if color == 'red':
-                for Candidate in self.whiteCells:
-                    if Candidate.redval >= self.pbound:
-                        Empty = Candidate
-                        break
-            elif color == 'blue':
-                for Candidate in self.whiteCells:
-                    if Candidate.blueval >=self.pbound:
-                        Empty = Candidate
-                        break
+            Empty = self.random_satisfying(color)
             
             ### No candidate for current color, try other color
             if Empty == None:
                 # print(f"CANT FIND SPOT FOR {color} CELL")
-                for OtherMoving in self.unsatisfied:
-                    otherColor = OtherMoving.color
+                for OtherMoving in unsatisfied:
+                    otherColor = cells[OtherMoving]
                     
                     if otherColor == color:
                         continue
 
-                    if otherColor == 'red':
-                        for Candidate in self.whiteCells:
-                            if Candidate.redval >= self.pbound:
-                                Moving = OtherMoving
-                                Empty = Candidate
-                                break
-                    elif otherColor == 'blue':
-                        for Candidate in self.whiteCells:
-                            if Candidate.blueval >=self.pbound:
-                                Moving = OtherMoving
-                                Empty = Candidate
-                                break
-                    
-                    if Empty == None:
-                        print(f"CATASTROPHIC STOP NO CELLS FOR RED OR BLUE!!!")
-                        return False
+                    Moving = OtherMoving
+                    Empty = self.random_satisfying(otherColor)
+                    break
+
+                if Empty == None:
+                    print(f"CATASTROPHIC STOP NO CELLS FOR RED OR BLUE!!!")
+                    self.settle_batch()
+                    return False
                     
-            self.whiteCells.remove(Empty)
-            self.unsatisfied.remove(Moving)
+            whites.remove(Empty)
+            unsatisfied.remove(Moving)
             
-            Empty.setcolor(Moving.color)
-            Moving.setcolor('white')
+            self.move_cell(Moving, Empty)
         
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
+        self.settle_batch()
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
 
-        self.animationList.append(self.to_np_colorcode())
+        self.record_frame()
         return True
 
     def step_whitebatch_randomSat_cont(self):
+        unsatisfied, whites = self.unsatisfied, self.whiteCells
+        cells = self.color_grid.ravel()
         
-        while self.unsatisfied and self.whiteCells:
-            Moving = random.sample(self.unsatisfied, k=1)[0]
-            random.shuffle(self.whiteCells)
-            Empty = None
-            color = Moving.color
+        unsatisfied.shuffle()
+        while unsatisfied and whites:
+            Moving = unsatisfied.last()
+            color = cells[Moving]
 
             ### Find Satisfying
-            if color == 'red':
-                for Candidate in self.whiteCells:
-                    if Candidate.redval >= self.pbound:
-                        Empty = Candidate
-                        break
-            elif color == 'blue':
-                for Candidate in self.whiteCells:
-                    if Candidate.blueval >=self.pbound:
-                        Empty = Candidate
-                        break
+            Empty = self.random_satisfying(color)
             
             ### No candidate for current color, select random
             if Empty == None:
                 # print(f"CANT FIND SPOT FOR {color} CELL")
-                Empty = random.sample(self.whiteCells, k=1)[0]
+                Empty = whites.pick()
                     
-            self.whiteCells.remove(Empty)
-            self.unsatisfied.remove(Moving)
-            self.whiteCells.append(Moving)
+            whites.remove(Empty)
+            unsatisfied.remove(Moving)
+            whites.append(Moving)
             
-            Empty.setcolor(Moving.color)
-            Moving.setcolor('white')
+            self.move_cell(Moving, Empty)
         
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
+        self.settle_batch()
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
 
-        self.animationList.append(self.to_np_colorcode())
+        self.record_frame()
         return True
     
     def step_batch_randomSat_cont(self):
-        while self.unsatisfied and self.whiteCells:
-            Moving = random.sample(self.unsatisfied, k=1)[0]
-            random.shuffle(self.whiteCells)
-            Empty = None
-            color = Moving.color
+        unsatisfied, whites = self.unsatisfied, self.whiteCells
+        cells = self.color_grid.ravel()
+        unsatisfied.shuffle()
+        while unsatisfied and whites:
+            Moving = unsatisfied.last()
+            color = cells[Moving]
 
             ### Find Satisfying
-            if color == 'red':
-                for Candidate in self.whiteCells:
-                    if Candidate.redval >= self.pbound:
-                        Empty = Candidate
-                        break
-            elif color == 'blue':
-                for Candidate in self.whiteCells:
-                    if Candidate.blueval >=self.pbound:
-                        Empty = Candidate
-                        break
+            Empty = self.random_satisfying(color)
             
             ### No candidate for current color, select random
             if Empty == None:
                 # print(f"CANT FIND SPOT FOR {color} CELL")
-                Empty = random.sample(self.whiteCells, k=1)[0]
+                Empty = whites.pick()
                     
-            self.whiteCells.remove(Empty)
-            self.unsatisfied.remove(Moving)
+            whites.remove(Empty)
+            unsatisfied.remove(Moving)
             
-            Empty.setcolor(Moving.color)
-            Moving.setcolor('white')
+            self.move_cell(Moving, Empty)
         
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
+        self.settle_batch()
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
 
-        self.animationList.append(self.to_np_colorcode())
+        self.record_frame()
         return True
     
     def step_whitebatch_closest(self):
-        while (self.unsatisfied and self.whiteCells):
-
-            Moving = random.sample(self.unsatisfied, k=1)[0]
-            self.whiteCells.sort(key = lambda Node: distance(Moving, Node))
-            Empty = self.whiteCells[0]
-            if len(self.unsatisfied)<self.stopping:
+        unsatisfied, whites = self.unsatisfied, self.whiteCells
+        neigh, satisfies = self.neigh.ravel(), self.satisfies
+        size = self.size
+        stopping = self.stopping
+        unsatisfied.shuffle()
+        while (unsatisfied and whites):
+
+            Moving = unsatisfied.last()
+            Empty = whites.closest_satisfying(*divmod(Moving, size), neigh, satisfies[WHITE])
+            if len(unsatisfied)<stopping:
+                self.settle_batch()
                 return False
             
-            self.whiteCells.remove(Empty)
-            self.unsatisfied.remove(Moving)
-            self.whiteCells.append(Moving)
+            whites.remove(Empty)
+            unsatisfied.remove(Moving)
+            whites.append(Moving)
 
-            Empty.setcolor(Moving.color)
-            Moving.setcolor('white')
+            self.move_cell(Moving, Empty)
 
         
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
+        self.settle_batch()
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
 
-        self.animationList.append(self.to_np_colorcode())
+        self.record_frame()
         return True
     
     def step_batch_closest(self):
-        while (self.unsatisfied and self.whiteCells):
-
-            Moving = random.sample(self.unsatisfied, k=1)[0]
-            self.whiteCells.sort(key = lambda Node: distance(Moving, Node))
-            Empty = self.whiteCells[0]
-            if len(self.unsatisfied)<self.stopping:
+        unsatisfied, whites = self.unsatisfied, self.whiteCells
+        neigh, satisfies = self.neigh.ravel(), self.satisfies
+        size = self.size
+        stopping = self.stopping
+        unsatisfied.shuffle()
+        while (unsatisfied and whites):
+
+            Moving = unsatisfied.last()
+            Empty = whites.closest_satisfying(*divmod(Moving, size), neigh, satisfies[WHITE])
+            if len(unsatisfied)<stopping:
+                self.settle_batch()
                 return False
             
-            self.whiteCells.remove(Empty)
-            self.unsatisfied.remove(Moving)
+            whites.remove(Empty)
+            unsatisfied.remove(Moving)
 
-            Empty.setcolor(Moving.color)
-            Moving.setcolor('white')
+            self.move_cell(Moving, Empty)
 
         
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
+        self.settle_batch()
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
 
-        self.animationList.append(self.to_np_colorcode())
+        self.record_frame()
         return True
     
     def step_whitebatch_closestSat_stop(self):
-        while self.unsatisfied and self.whiteCells:
-            Moving = random.sample(self.unsatisfied, k=1)[0]
-            self.whiteCells.sort(key = lambda Node: distance(Moving, Node))
-            Empty = None
-            color = Moving.color
+        unsatisfied, whites = self.unsatisfied, self.whiteCells
+        cells = self.color_grid.ravel()
+        neigh, satisfies = self.neigh.ravel(), self.satisfies
+        size = self.size
+        stopping = self.stopping
+        unsatisfied.shuffle()
+        while unsatisfied and whites:
+            Moving = unsatisfied.last()
+            mx, my = divmod(Moving, size)
+            color = cells[Moving]
             
-            if len(self.unsatisfied)<self.stopping:
+            if len(unsatisfied)<stopping:
+                self.settle_batch()
                 return False
             
             ### Find Satisfying
-            if color == 'red':
-                for Candidate in self.whiteCells:
-                    if Candidate.redval >= self.pbound:
-                        Empty = Candidate
-                        break
-            elif color == 'blue':
-                for Candidate in self.whiteCells:
-                    if Candidate.blueval >=self.pbound:
-                        Empty = Candidate
-                        break
+            Empty = whites.closest_satisfying(mx, my, neigh, satisfies[color])
             
             ### No candidate for current color, try other color
             if Empty == None:
                 # print(f"CANT FIND SPOT FOR {color} CELL")
-                for OtherMoving in self.unsatisfied:
-                    otherColor = OtherMoving.color
+                for OtherMoving in unsatisfied:
+                    otherColor = cells[OtherMoving]
                     
                     if otherColor == color:
                         continue
                     
-                    self.whiteCells.sort(key = lambda Node: distance(OtherMoving, Node))
-                    if otherColor == 'red':
-                        for Candidate in self.whiteCells:
-                            if Candidate.redval >= self.pbound:
-                                Moving = OtherMoving
-                                Empty = Candidate
-                                break
-                    elif otherColor == 'blue':
-                        for Candidate in self.whiteCells:
-                            if Candidate.blueval >=self.pbound:
-                                Moving = OtherMoving
-                                Empty = Candidate
-                                break
+                    ox, oy = divmod(OtherMoving, size)
+                    Moving = OtherMoving
+                    Empty = whites.closest_satisfying(ox, oy, neigh, satisfies[otherColor])
                     
-                    if Empty == None:
-                        print(f"CATASTROPHIC STOP NO CELLS FOR RED OR BLUE!!!")
-                        return False
+                    break
+
+                if Empty == None:
+                    print(f"CATASTROPHIC STOP NO CELLS FOR RED OR BLUE!!!")
+                    self.settle_batch()
+                    return False
             
-            self.unsatisfied.remove(Moving)
-            self.whiteCells.remove(Empty)
-            self.whiteCells.append(Moving)
+            unsatisfied.remove(Moving)
+            whites.remove(Empty)
+            whites.append(Moving)
 
-            Empty.setcolor(Moving.color)
-            Moving.setcolor('white')
+            self.move_cell(Moving, Empty)
         
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
+        self.settle_batch()
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
 
-        self.animationList.append(self.to_np_colorcode())
+        self.record_frame()
         return True
     
     def step_batch_closestSat_stop(self):
-        while self.unsatisfied and self.whiteCells:
-            Moving = random.sample(self.unsatisfied, k=1)[0]
-            self.whiteCells.sort(key = lambda Node: distance(Moving, Node))
-            Empty = None
-            color = Moving.color
+        unsatisfied, whites = self.unsatisfied, self.whiteCells
+        cells = self.color_grid.ravel()
+        neigh, satisfies = self.neigh.ravel(), self.satisfies
+        size = self.size
+        stopping = self.stopping
+        unsatisfied.shuffle()
+        while unsatisfied and whites:
+            Moving = unsatisfied.last()
+            mx, my = divmod(Moving, size)
+            color = cells[Moving]
             
-            if len(self.unsatisfied)<self.stopping:
+            if len(unsatisfied)<stopping:
+                self.settle_batch()
                 return False
             
             ### Find Satisfying
-            if color == 'red':
-                for Candidate in self.whiteCells:
-                    if Candidate.redval >= self.pbound:
-                        Empty = Candidate
-                        break
-            elif color == 'blue':
-                for Candidate in self.whiteCells:
-                    if Candidate.blueval >=self.pbound:
-                        Empty = Candidate
-                        break
+            Empty = whites.closest_satisfying(mx, my, neigh, satisfies[color])
             
             ### No candidate for current color, try other color
             if Empty == None:
                 # print(f"CANT FIND SPOT FOR {color} CELL")
-                for OtherMoving in self.unsatisfied:
-                    otherColor = OtherMoving.color
+                for OtherMoving in unsatisfied:
+                    otherColor = cells[OtherMoving]
                     
                     if otherColor == color:
                         continue
                     
-                    self.whiteCells.sort(key = lambda Node: distance(OtherMoving, Node))
-                    if otherColor == 'red':
-                        for Candidate in self.whiteCells:
-                            if Candidate.redval >= self.pbound:
-                                Moving = OtherMoving
-                                Empty = Candidate
-                                break
-                    elif otherColor == 'blue':
-                        for Candidate in self.whiteCells:
-                            if Candidate.blueval >=self.pbound:
-                                Moving = OtherMoving
-                                Empty = Candidate
-                                break
+                    ox, oy = divmod(OtherMoving, size)
+                    Moving = OtherMoving
+                    Empty = whites.closest_satisfying(ox, oy, neigh, satisfies[otherColor])
                     
-                    if Empty == None:
-                        print(f"CATASTROPHIC STOP NO CELLS FOR RED OR BLUE!!!")
-                        return False
+                    break
+
+                if Empty == None:
+                    print(f"CATASTROPHIC STOP NO CELLS FOR RED OR BLUE!!!")
+                    self.settle_batch()
+                    return False
             
-            self.unsatisfied.remove(Moving)
-            self.whiteCells.remove(Empty)
+            unsatisfied.remove(Moving)
+            whites.remove(Empty)
 
-            Empty.setcolor(Moving.color)
-            Moving.setcolor('white')
+            self.move_cell(Moving, Empty)
         
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
+        self.settle_batch()
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
 
-        self.animationList.append(self.to_np_colorcode())
+        self.record_frame()
         return True
      
     def step_whitebatch_closestSat_cont(self):
-        while self.unsatisfied and self.whiteCells:
-            Moving = random.sample(self.unsatisfied, k=1)[0]
-            self.whiteCells.sort(key = lambda Node: distance(Moving, Node))
-            Empty = None
-            color = Moving.color
+        unsatisfied, whites = self.unsatisfied, self.whiteCells
+        cells = self.color_grid.ravel()
+        neigh, satisfies = self.neigh.ravel(), self.satisfies
+        size = self.size
+        stopping = self.stopping
+        unsatisfied.shuffle()
+        while unsatisfied and whites:
+            Moving = unsatisfied.last()
+            mx, my = divmod(Moving, size)
+            color = cells[Moving]
             
-            if len(self.unsatisfied)<self.stopping:
+            if len(unsatisfied)<stopping:
+                self.settle_batch()
                 return False
             
             ### Find Satisfying
-            if color == 'red':
-                for Candidate in self.whiteCells:
-                    if Candidate.redval >= self.pbound:
-                        Empty = Candidate
-                        break
-            elif color == 'blue':
-                for Candidate in self.whiteCells:
-                    if Candidate.blueval >=self.pbound:
-                        Empty = Candidate
-                        break
+            Empty = whites.closest_satisfying(mx, my, neigh, satisfies[color])
             
             ### No candidate for current color, select closest
             if Empty == None:
                 # print(f"CANT FIND SPOT FOR {color} CELL")
-                Empty = self.whiteCells[0]
+                Empty = whites.closest_satisfying(mx, my, neigh, satisfies[WHITE])
                 
-            self.unsatisfied.remove(Moving)
-            self.whiteCells.remove(Empty)
-            self.whiteCells.append(Moving)
+            unsatisfied.remove(Moving)
+            whites.remove(Empty)
+            whites.append(Moving)
 
-            Empty.setcolor(Moving.color)
-            Moving.setcolor('white')
+            self.move_cell(Moving, Empty)
             
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
+        self.settle_batch()
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
 
-        self.animationList.append(self.to_np_colorcode())
+        self.record_frame()
         return True
     
     def step_batch_closestSat_cont(self):
-        while self.unsatisfied and self.whiteCells:
-            Moving = random.sample(self.unsatisfied, k=1)[0]
-            self.whiteCells.sort(key = lambda Node: distance(Moving, Node))
-            Empty = None
-            color = Moving.color
+        unsatisfied, whites = self.unsatisfied, self.whiteCells
+        cells = self.color_grid.ravel()
+        neigh, satisfies = self.neigh.ravel(), self.satisfies
+        size = self.size
+        stopping = self.stopping
+        unsatisfied.shuffle()
+        while unsatisfied and whites:
+            Moving = unsatisfied.last()
+            mx, my = divmod(Moving, size)
+            color = cells[Moving]
             
-            if len(self.unsatisfied)<self.stopping:
+            if len(unsatisfied)<stopping:
+                self.settle_batch()
                 return False
             
             ### Find Satisfying
-            if color == 'red':
-                for Candidate in self.whiteCells:
-                    if Candidate.redval >= self.pbound:
-                        Empty = Candidate
-                        break
-            elif color == 'blue':
-                for Candidate in self.whiteCells:
-                    if Candidate.blueval >=self.pbound:
-                        Empty = Candidate
-                        break
+            Empty = whites.closest_satisfying(mx, my, neigh, satisfies[color])
             
             ### No candidate for current color, select closest
             if Empty == None:
                 # print(f"CANT FIND SPOT FOR {color} CELL")
-                Empty = self.whiteCells[0]
+                Empty = whites.closest_satisfying(mx, my, neigh, satisfies[WHITE])
                 
-            self.unsatisfied.remove(Moving)
-            self.whiteCells.remove(Empty)
+            unsatisfied.remove(Moving)
+            whites.remove(Empty)
 
-            Empty.setcolor(Moving.color)
-            Moving.setcolor('white')
+            self.move_cell(Moving, Empty)
             
-        self.reload_sets()
-        print(len(self.unsatisfied), len(self.whiteCells))
+        self.settle_batch()
+        if self.verbose:
+            print(len(self.unsatisfied), len(self.whiteCells))
 
-        self.animationList.append(self.to_np_colorcode())
+        self.record_frame()
         return True
 
     def to_np_pvals(self):
         '''
         Returns the pval of each node as a 2D numpy array.
         '''
-        return np.array([[self.board[i][j].pval for j in range(self.size)] for i in range(self.size)])
+        return self.pval.copy()
     
     def to_np_colorcode(self):
         '''
         Returns a 2D numpy array encoding red cells as 100, blue as -100, and white as 0.
         '''
-        values = []
-        for i in range(self.size):
-            current_row = []
-            for j in range(self.size):
-                current_node_color = self.board[i][j].color
-                if current_node_color == 'white':
-                    current_row.append(0)
-                elif current_node_color == 'red':
-                    current_row.append(100)
-                else:
-                    current_row.append(-100)
-            values.append(current_row)
-        return np.array(values)
+        return COLORCODE[self.color_grid]
     
+    ### Assignment algorithm names accepted by run, mapped to their step methods.
+    algoDict = {"singleRandom":step_single_random,
+                "singleClosest":step_single_closest,
+                "singleRandomSatisfyStop":step_single_randomSat_stop,
+                "singleRandomSatisfyContinue":step_single_randomSat_cont,
+                "singleClosestSatisfyStop":step_single_closestSat_stop,
+                "singleClosestSatisfyContinue":step_single_closestSat_cont,
+                "whitebatchRandom":step_whitebatch_random,
+                "batchRandom":step_batch_random,
+                "whitebatchRandomSatisfyStop":step_whitebatch_randomSat_stop,
+                "batchRandomSatisfyStop":step_batch_randomSat_stop,
+                "whitebatchRandomSatisfyContinue":step_whitebatch_randomSat_cont,
+                "batchRandomSatisfyContinue":step_batch_randomSat_cont,
+                "whitebatchClosest":step_whitebatch_closest,
+                "batchClosest":step_batch_closest,
+                "whitebatchClosestSatisfyStop":step_whitebatch_closestSat_stop,
+                "batchClosestSatisfyStop":step_batch_closestSat_stop,
+                "whitebatchClosestSatisfyContinue":step_whitebatch_closestSat_cont,
+                "batchClosestSatisfyContinue":step_batch_closestSat_cont}
+
     def run(self, iters, assignAlgorithm):
         '''
         Runs the simulation.
@@ -912,35 +1184,19 @@ class Board():
         Returns:
             i: integer, number of iterations executed.
         '''
-
-        algoDict = {"singleRandom":self.step_single_random,
-                        "singleClosest":self.step_single_closest,
-                        "singleRandomSatisfyStop":self.step_single_randomSat_stop,
-                        "singleRandomSatisfyContinue":self.step_single_randomSat_cont,
-                        "singleClosestSatisfyStop":self.step_single_closestSat_stop,
-                        "singleClosestSatisfyContinue":self.step_single_closestSat_cont,
-                        "whitebatchRandom":self.step_whitebatch_random,
-                        "batchRandom":self.step_batch_random,
-                        "whitebatchRandomSatisfyStop":self.step_whitebatch_randomSat_stop,
-                        "batchRandomSatisfyStop":self.step_batch_randomSat_stop,
-                        "whitebatchRandomSatisfyContinue":self.step_whitebatch_randomSat_cont,
-                        "batchRandomSatisfyContinue":self.step_batch_randomSat_cont,
-                        "whitebatchClosest":self.step_whitebatch_closest,
-                        "batchClosest":self.step_batch_closest,
-                        "whitebatchClosestSatisfyStop":self.step_whitebatch_closestSat_stop,
-                        "batchClosestSatisfyStop":self.step_batch_closestSat_stop,
-                        "whitebatchClosestSatisfyContinue":self.step_whitebatch_closestSat_cont,
-                        "batchClosestSatisfyContinue":self.step_batch_closestSat_cont}
-        
-        if assignAlgorithm in algoDict:
-            stepfunction = algoDict[assignAlgorithm]
+        if assignAlgorithm in self.algoDict:
+            stepfunction = self.algoDict[assignAlgorithm].__get__(self, Board)
         else:
             raise ValueError(f"Wrong function name in run: '{assignAlgorithm}'.")
+        ### iters is only an upper bound and most runs converge long before it, so only
+        ### a first chunk is reserved and record_frame doubles the buffer from there.
+        self.reserve_frames(min(iters, max(16, self.frame_count)))
+        unsatisfied = self.unsatisfied
         i = 0
 
         Running = True
         while (i < iters) and Running:
-            if (not self.unsatisfied):
+            if (not unsatisfied):
                 print(f"Converged to stable position with {assignAlgorithm} for board of p={self.pbound}.")
                 break
             Running = stepfunction()
@@ -951,7 +1207,8 @@ class Board():
         
     def animate(self, total_frames=200, frame_jump=None, interval=0.5):
         '''
-        After board has been run, plays frames in animation list.
+        After board has been run, plays frames in animation list. Frames are stored
+        in a uint8 buffer of color grids and encoded like to_np_colorcode on playback.
         Arguments:
             total_frames: integer, approximate number of frames to play, higher causes greater jumps
                 in animation list when scanning.
@@ -960,18 +1217,19 @@ class Board():
         '''
 
         fig = plt.figure()
+        frames = self.frames[:self.frame_count]
         if frame_jump == None:
-            frame_jump = len(self.animationList)//total_frames+1
+            frame_jump = len(frames)//total_frames+1
 
-        heatmap(self.animationList[0], cmap='vlag', xticklabels=False, yticklabels=False, cbar=False)
+        heatmap(COLORCODE[frames[0]], cmap='vlag', xticklabels=False, yticklabels=False, cbar=False)
 
-        animationList = self.animationList[::frame_jump]
-        animationList.append(self.animationList[-1])
+        animationList = list(frames[::frame_jump])
+        animationList.append(frames[-1])
         time = len(animationList)
 
         def animate_step(i):
             fig.clear()
-            heatmap(animationList[i], cmap='vlag', xticklabels=False, yticklabels=False, cbar=False)
+            heatmap(COLORCODE[animationList[i]], cmap='vlag', xticklabels=False, yticklabels=False, cbar=False)
 
         anim = animation.FuncAnimation(fig, animate_step, frames=time, repeat = True, interval=interval)
         plt.show()
@@ -979,15 +1237,11 @@ class Board():
         return anim
     def averagepval(self):
         '''
-        Returns the average pval across all non-empty nodes.
+        Returns the average pval across all non-empty nodes. Empty nodes have pval
+        of exactly 1, so their share is subtracted from the plain board sum.
         '''
-        pvalcount = 0
-        for row in self.board:
-            for node in row:
-                if node.color != 'white':
-                    pvalcount += node.pval
-
-        return pvalcount/(self.size**2 - len(self.whiteCells))
+        whites = len(self.whiteCells)
+        return (self.pval.sum() - whites)/(self.size**2 - whites)
 
 #### Example usage, creating and animating a batch random assignment board. #####
 # randomboard = Board(50, 0.1, 0.5, 0.6, 1)
@@ -996,13 +1250,19 @@ class Board():
 
 ##### Testing a range of values for the single closest satisfying with stops assigning algorithm. #####
 ##### Plots the linear dependence between pbound and the ending average pval ######
-# testingRange = np.linspace(0, 1, 20)
-# results = []
-# for pval in testingRange:
+##### The boards are independent, so they are run in parallel, one process per board. #####
+# from concurrent.futures import ProcessPoolExecutor
+#
+# def run_one(pval):
 #     currentboard = Board(50, 0.1, 0.5, pval, 10)
-#     print(f"Finished {pval} in {currentboard.run(6000, "singleClosestSatisfyStop")} steps.")
+#     print(f"Finished {pval} in {currentboard.run(6000, 'singleClosestSatisfyStop')} steps.")
 #     currentpval = currentboard.averagepval()
 #     print(f"Average pval = {currentpval}.")
-#     results.append(currentpval)
-# lineplot(x = testingRange, y = results)
-# plt.show()
\ No newline at end of file
+#     return currentpval
+#
+# if __name__ == '__main__':
+#     testingRange = np.linspace(0, 1, 20)
+#     with ProcessPoolExecutor() as executor:
+#         results = list(executor.map(run_one, testingRange))
+#     lineplot(x = testingRange, y = results)
+#     plt.show()
\ No newline at end of file